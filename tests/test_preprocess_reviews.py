@@ -0,0 +1,89 @@
+import os
+import re
+import sys
+
+import pandas as pd
+import pytest
+from langdetect import DetectorFactory
+from nltk.corpus import stopwords
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transform  # noqa: E402
+
+# langdetect is randomized unless seeded; both implementations must see the
+# same detected language for every review
+DetectorFactory.seed = 0
+
+
+# The per-row implementation preprocess_reviews replaced
+def preprocess_and_split_reviews(reviews):
+    if pd.isna(reviews):
+        return ""
+    reviews = str(reviews)
+    try:
+        stop_words = set(stopwords.words(transform.get_stopwords_language(reviews)))
+    except Exception:
+        stop_words = set(stopwords.words('english'))
+
+    reviews = re.sub('\\s+', ' ', reviews).strip().lower()
+    reviews = re.sub(r'[^\u0000-\u007F]+', '', reviews)
+
+    words = [word for word in reviews.split() if word not in stop_words and len(word) > 1]
+    return ' '.join(words)
+
+
+REVIEWS = pd.Series(
+    [
+        "This app is really great, I use it   every day!",
+        float("nan"),
+        "Die App ist nicht schlecht, aber sie stürzt oft ab.",
+        "L'application est très utile et je la recommande à tous.",
+        None,
+        "",
+        "Приложение очень удобное, но иногда зависает.",
+        "हिन्दी भाषा बहुत अच्छी है 😀",
+        "ดีมาก ใช้งานง่าย",
+        "Great app “love it” … 5/5 ★★★★★",
+        12345,
+        "   \t\n  ",
+        "a b c",
+    ],
+    index=[10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22],
+)
+
+
+def test_matches_per_row_implementation():
+    expected = REVIEWS.apply(preprocess_and_split_reviews)
+    processed = transform.preprocess_reviews(REVIEWS)
+
+    pd.testing.assert_series_equal(processed, expected, check_names=False)
+
+
+def test_missing_reviews_become_empty_strings():
+    processed = transform.preprocess_reviews(pd.Series([float("nan"), None, "Nice app"]))
+
+    assert processed.tolist() == ["", "", "nice app"]
+
+
+@pytest.mark.parametrize(
+    "review, expected",
+    [
+        ("हिन्दी भाषा बहुत अच्छी है", "हिन्दी भाषा बहुत अच्छी है"),
+        ("ดีมาก 😀", "ดีมาก"),
+        ("Great “app” … ★★★★★", "great app"),
+        ("Cafe\u0301 app, naïve design!", "cafe\u0301 app, naïve design!"),
+        ("«Très» bien‼", "très bien"),
+        (float("nan"), ""),
+    ],
+)
+def test_keep_unicode_keeps_letters_and_combining_marks(review, expected):
+    processed = transform.preprocess_reviews(pd.Series([review]), keep_unicode=True)
+
+    assert processed[0] == expected
+
+
+def test_default_strips_non_ascii_text():
+    processed = transform.preprocess_reviews(pd.Series(["हिन्दी भाषा", "Great “app”"]))
+
+    assert processed.tolist() == ["", "great app"]
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import sys
+import tarfile
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transform  # noqa: E402
+
+TABLES = {
+    "AppStore_Genres.csv": pd.DataFrame({"appId": ["a", "a", "b"], "genres": ["Games", "Puzzle", None]}),
+    "AppStore_Languages.csv": pd.DataFrame({"appId": ["a", "b"], "languages": ["EN", "FR"]}),
+}
+
+
+def publish(output_dir, bundle=False):
+    outputs = transform.RunOutputs("AppStore", output_dir, bundle=bundle)
+    for file_name, table in TABLES.items():
+        outputs.add(table, file_name)
+    outputs.write()
+    return outputs
+
+
+def run_directories(parent):
+    return sorted(name for name in os.listdir(parent) if name.startswith(".out-"))
+
+
+def test_manifest_matches_written_files(tmp_path):
+    output_dir = tmp_path / "out"
+    publish(str(output_dir), bundle=True)
+
+    with open(output_dir / "manifest.json") as manifest_file:
+        manifest = json.load(manifest_file)
+    assert manifest["store"] == "AppStore"
+    assert [table["file"] for table in manifest["tables"]] == list(TABLES)
+    for entry in manifest["tables"]:
+        path = output_dir / entry["file"]
+        assert entry["rows"] == len(pd.read_csv(path)) == len(TABLES[entry["file"]])
+        assert entry["bytes"] == os.path.getsize(path)
+        assert entry["sha256"] == hashlib.sha256(path.read_bytes()).hexdigest()
+        assert [column["name"] for column in entry["schema"]] == list(TABLES[entry["file"]].columns)
+
+    with tarfile.open(output_dir / "AppStore_outputs.tar.gz") as bundle:
+        assert sorted(bundle.getnames()) == sorted(["manifest.json", *TABLES])
+
+
+def test_only_keep_previous_runs_are_kept(tmp_path):
+    output_dir = tmp_path / "out"
+    for _ in range(transform.KEEP_PREVIOUS_RUNS + 3):
+        publish(str(output_dir))
+
+    current = os.readlink(output_dir)
+    assert current in run_directories(tmp_path)
+    assert len(run_directories(tmp_path)) == transform.KEEP_PREVIOUS_RUNS + 1
+    assert sorted(os.listdir(output_dir)) == sorted(["manifest.json", *TABLES])
+
+
+def test_existing_plain_directory_is_refused_and_left_untouched(tmp_path):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    (output_dir / "keep.txt").write_text("user data")
+
+    with pytest.raises(FileExistsError):
+        publish(str(output_dir))
+
+    assert os.listdir(output_dir) == ["keep.txt"]
+    assert run_directories(tmp_path) == []
+
+
+def test_foreign_symlink_is_refused_and_target_left_untouched(tmp_path):
+    precious = tmp_path / "precious"
+    precious.mkdir()
+    (precious / "keep.txt").write_text("user data")
+    output_dir = tmp_path / "out"
+    output_dir.symlink_to(precious)
+
+    with pytest.raises(FileExistsError):
+        publish(str(output_dir))
+
+    assert os.readlink(output_dir) == str(precious)
+    assert os.listdir(precious) == ["keep.txt"]
+    assert run_directories(tmp_path) == []
+
+
+def test_default_mode_writes_to_the_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    publish(None)
+
+    assert sorted(os.listdir(tmp_path)) == sorted(TABLES)
+    for file_name, table in TABLES.items():
+        pd.testing.assert_frame_equal(pd.read_csv(file_name), table)
@@ -0,0 +1,98 @@
+import filecmp
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import transform  # noqa: E402
+
+# Few enough apps that several of the shards get no rows at all
+FIXTURE_APPS = 12
+SHARD_COUNT = 16
+
+
+# Deterministic stand-in for the BERT sentiment pipeline
+def fake_sentiment_analyzer(text, **kwargs):
+    stars = len(str(text)) % 5 + 1
+    return [{"label": "1 star" if stars == 1 else f"{stars} stars"}]
+
+
+@pytest.fixture(autouse=True)
+def no_model(monkeypatch):
+    monkeypatch.setattr(transform, "get_sentiment_analyzer", lambda: fake_sentiment_analyzer)
+
+
+def make_run_directory(path, input_file):
+    os.makedirs(path)
+    # Read as text so the fixture keeps the values of the scraped file exactly
+    pd.read_csv(os.path.join(REPO, input_file), dtype=str, keep_default_na=False).head(
+        FIXTURE_APPS
+    ).to_csv(os.path.join(path, input_file), index=False)
+
+
+@pytest.mark.parametrize(
+    "store_name, transform_function, output_files",
+    [
+        ("AppStore", transform.transform_AppStoreData, transform.APP_STORE_OUTPUTS),
+        ("GooglePlay", transform.transform_GooglePlayData, transform.GOOGLE_PLAY_OUTPUTS),
+    ],
+)
+def test_merged_shards_match_single_run(
+    tmp_path, monkeypatch, store_name, transform_function, output_files
+):
+    input_file = f"{store_name}Output.csv"
+    single, sharded = tmp_path / "single", tmp_path / "sharded"
+    make_run_directory(single, input_file)
+    make_run_directory(sharded, input_file)
+
+    monkeypatch.chdir(single)
+    transform_function(input_file, None)
+
+    monkeypatch.chdir(sharded)
+    for index in range(SHARD_COUNT):
+        transform_function(input_file, None, shard=(index, SHARD_COUNT))
+    transform.merge_shards(store_name)
+
+    for file_name in output_files:
+        assert filecmp.cmp(single / file_name, sharded / file_name, shallow=False), file_name
+    assert not [name for name in os.listdir(sharded) if ".shard-" in name]
+
+
+def write_shard(table, index, count):
+    outputs = transform.RunOutputs("GooglePlay", shard=(index, count, "test"))
+    outputs.add(table, "GooglePlay_Test.csv")
+    outputs.write()
+    return {
+        (row.file, row.column): row.dtype
+        for row in pd.read_csv(
+            transform.shard_file_name("GooglePlay_Shard_Dtypes.csv", (index, count, "test")),
+            dtype=str,
+        ).itertuples()
+    }
+
+
+def test_merge_keeps_nullable_integers_and_upcasts_mixed_columns(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    single = pd.DataFrame(
+        {
+            "review_sample_size": pd.array([5, 7, pd.NA], dtype="Int64"),
+            "app_age": [1695.0, 20.0, float("nan")],
+        }
+    )
+    shards = [
+        single.iloc[[0, 1]].astype({"app_age": "int64"}),  # only sampled apps, no NaN
+        single.iloc[[2]],  # no sampled apps
+        single.iloc[[]],  # no rows
+    ]
+    shard_dtypes = [write_shard(table, index, len(shards)) for index, table in enumerate(shards)]
+    transform.save_output(single, "single.csv")
+
+    merged = transform.merge_shard_files("GooglePlay_Test.csv", "test", shard_dtypes)
+    merged.to_csv("merged.csv", index=False)
+
+    with open("single.csv") as expected, open("merged.csv") as actual:
+        assert actual.read() == expected.read()
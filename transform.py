@@ -1,26 +1,44 @@
 import pandas as pd
+import numpy as np
 from textblob import TextBlob
 from ast import literal_eval
 import re
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import json
+import math
 import argparse
 from iso639 import languages
 import nltk
 from nltk.corpus import stopwords
 from collections import Counter
-from transformers import pipeline
-from transformers import AutoTokenizer
+from itertools import chain
+from functools import lru_cache
 from langdetect import detect
 import os
-
-
-# Load the sentiment analysis pipeline with the multilingual BERT model
-sentiment_analyzer = pipeline(
-    "sentiment-analysis", model="nlptown/bert-base-multilingual-uncased-sentiment"
-    )
-tokenizer = AutoTokenizer.from_pretrained(
-    "nlptown/bert-base-multilingual-uncased-sentiment"
+import sys
+import time
+import subprocess
+import zlib
+import unicodedata
+import sqlite3
+import fcntl
+import hashlib
+import io
+import shutil
+import tarfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+
+# Load the sentiment analysis pipeline with the multilingual BERT model on
+# first use, so code that never scores sentiment does not load the model
+@lru_cache(maxsize=None)
+def get_sentiment_analyzer():
+    from transformers import pipeline
+
+    return pipeline(
+        "sentiment-analysis", model="nlptown/bert-base-multilingual-uncased-sentiment"
     )
 
 # Define function to ensure stopwords are available
@@ -33,12 +51,1351 @@ def ensure_stopwords():
         print("Stopwords already installed.")
 ensure_stopwords()
 
-# Example transformation function
-def transform_AppStoreData(input_file, output_file):
+# Mapping from language names to NLTK compatible language codes
+NLTK_LANG_MAP = {
+    "ar": "arabic",
+    "az": "azerbaijani",
+    "eu": "basque",
+    "bn": "bengali",
+    "ca": "catalan",
+    "zh": "chinese",
+    "da": "danish",
+    "nl": "dutch",
+    "en": "english",
+    "fi": "finnish",
+    "fr": "french",
+    "de": "german",
+    "el": "greek",
+    "he": "hebrew",
+    "hu": "hungarian",
+    "id": "indonesian",
+    "it": "italian",
+    "kk": None,  # No support in NLTK
+    "ne": None,  # No support in NLTK
+    "no": "norwegian",
+    "pt": "portuguese",
+    "ro": "romanian",
+    "ru": "russian",
+    "sl": "slovene",
+    "es": "spanish",
+    "sv": "swedish",
+    "tg": None,  # No support in NLTK
+    "tr": "turkish",
+}
+
+# Regex character class (without brackets) of every non-ASCII code point whose
+# Unicode general category starts with one of the given letters, e.g. "M" for
+# combining marks or "SPC" for symbols, punctuation and control/format/unassigned
+def unicode_category_class(categories):
+    ranges = []
+    for code_point in range(0x80, sys.maxunicode + 1):
+        if unicodedata.category(chr(code_point))[0] not in categories:
+            continue
+        if ranges and ranges[-1][1] == code_point - 1:
+            ranges[-1][1] = code_point
+        else:
+            ranges.append([code_point, code_point])
+    return "".join(
+        f"\\U{start:08x}" if start == end else f"\\U{start:08x}-\\U{end:08x}"
+        for start, end in ranges
+    )
+
+
+# Patterns used by the review normalization, compiled once per process
+WHITESPACE_PATTERN = re.compile(r"\s+")
+NON_ASCII_PATTERN = re.compile(r"[^\u0000-\u007F]+")
+# Unicode-aware variant: keeps letters, combining marks (needed by Devanagari,
+# Thai, ...) and digits of every script and only drops non-ASCII symbols,
+# punctuation and control characters such as emoji or typographic quotes
+NON_ASCII_SYMBOL_PATTERN = re.compile(f"[{unicode_category_class('SPC')}]+")
+
+
+# Detect the language of a review and return the matching NLTK stopword language
+def get_stopwords_language(text):
+    try:
+        lang = detect(text)
+        return NLTK_LANG_MAP.get(lang, "english") or "english"
+    except Exception as e:
+        print("Error in detecting language or loading stopwords:", e)
+        return "english"
+
+
+# Stopword lists are loaded once per language instead of once per review
+@lru_cache(maxsize=None)
+def get_stopwords_index(language):
+    try:
+        return pd.Index(stopwords.words(language))
+    except Exception as e:
+        print("Error in detecting language or loading stopwords:", e)
+        return pd.Index(stopwords.words("english"))
+
+
+# Normalize a whole column of reviews and remove language-specific stopwords.
+# Whitespace collapsing, lower-casing and character stripping run as column-wide
+# string operations; the words are then exploded into one long Series and
+# filtered against the stopword Index of each detected language at once.
+# With keep_unicode=False non-ASCII characters are removed (the historical
+# behaviour, which empties non-Latin reviews); keep_unicode=True keeps letters
+# of any script and only strips non-ASCII symbols.
+def preprocess_reviews(reviews, keep_unicode=False):
+    original_index = reviews.index
+    reviews = reviews.reset_index(drop=True)
+
+    # Convert reviews to string, NaN reviews end up as an empty string
+    text = reviews[reviews.notna()].astype(str)
+    review_languages = text.apply(get_stopwords_language)
+
+    text = text.str.replace(WHITESPACE_PATTERN, " ", regex=True).str.strip().str.lower()
+    strip_pattern = NON_ASCII_SYMBOL_PATTERN if keep_unicode else NON_ASCII_PATTERN
+    text = text.str.replace(strip_pattern, "", regex=True)
+
+    words = text.str.split().explode()
+    words = words[words.notna() & (words.str.len() > 1)]
+    word_languages = review_languages.loc[words.index].to_numpy()
+
+    is_stopword = np.zeros(len(words), dtype=bool)
+    for language in pd.unique(word_languages):
+        in_language = word_languages == language
+        is_stopword[in_language] = words[in_language].isin(get_stopwords_index(language))
+
+    processed = words[~is_stopword].groupby(level=0).agg(" ".join)
+    processed = processed.reindex(reviews.index, fill_value="")
+    processed.index = original_index
+    return processed
+
+
+JSON_DECODER = json.JSONDecoder()
+
+
+# Decode a column of JSON strings. Every row is scanned with raw_decode, which
+# skips the per-call overhead of json.loads, and only counts as decoded when
+# the JSON value spans the whole row, so a malformed row can never borrow or
+# lend values to its neighbours. Rows that fail (surrounding whitespace,
+# invalid JSON) go through json.loads and then the optional fallback parser
+# (e.g. literal_eval). Returns the decoded values and a boolean mask of the
+# rows that were decoded; missing and undecodable rows decode to None.
+def decode_json_column(values, fallback=None):
+    valid = np.array([isinstance(value, str) for value in values], dtype=bool)
+
+    decoded = [None] * len(values)
+    for position in np.flatnonzero(valid):
+        value = values[position]
+        try:
+            decoded_value, end = JSON_DECODER.raw_decode(value)
+            if end == len(value):
+                decoded[position] = decoded_value
+                continue
+        except json.JSONDecodeError:
+            pass
+        try:
+            decoded[position] = json.loads(value)
+            continue
+        except json.JSONDecodeError:
+            pass
+        if fallback is None:
+            valid[position] = False
+            continue
+        try:
+            decoded[position] = fallback(value)
+        except (ValueError, SyntaxError, TypeError):
+            valid[position] = False
+    return decoded, valid
+
+
+HISTOGRAM_KEYS = ["1", "2", "3", "4", "5"]
+HISTOGRAM_COLUMNS = ["1*", "2*", "3*", "4*", "5*"]
+
+
+INT32_MAX = np.iinfo(np.int32).max
+
+
+# A histogram count that fits the int32 counts array
+def is_histogram_count(count):
+    return (
+        isinstance(count, (int, float))
+        and not isinstance(count, bool)
+        and math.isfinite(count)
+        and -INT32_MAX <= count <= INT32_MAX
+    )
+
+
+# Decode a whole column of JSON rating histograms into a preallocated (n, 5)
+# int32 array. Returns the counts and a boolean mask of the rows that could be
+# decoded; histograms with a non-numeric count (e.g. null) or a count outside
+# the int32 range are not valid.
+def parse_histograms(histograms):
+    values = histograms.to_numpy(dtype=object)
+    counts = np.zeros((len(values), len(HISTOGRAM_KEYS)), dtype=np.int32)
+    decoded, valid = decode_json_column(values)
+
+    for position, histogram in enumerate(decoded):
+        if not isinstance(histogram, dict):
+            valid[position] = False
+            continue
+        row = [histogram.get(key, 0) for key in HISTOGRAM_KEYS]
+        if all(is_histogram_count(count) for count in row):
+            counts[position] = row
+        else:
+            valid[position] = False
+    return counts, valid
+
+
+# Decode a JSON/Python list-encoded column (genres, languages) straight into a
+# long (appId, value) table. Like DataFrame.explode, the source row index is
+# kept and apps with an empty or missing list keep one row with a NaN value. Rows that cannot be decoded as a
+# list are reported and returned separately instead of being kept as text.
+def explode_list_column(df, column, id_column="appId"):
+    raw_values = df[column].to_numpy(dtype=object)
+    decoded, _ = decode_json_column(raw_values, fallback=literal_eval)
+
+    is_list = np.array([isinstance(value, list) for value in decoded], dtype=bool)
+    is_text = np.array([isinstance(value, str) for value in raw_values], dtype=bool)
+    is_bad = is_text & ~is_list
+    items = [
+        value if is_list[position] and value else [float("nan")]
+        for position, value in enumerate(decoded)
+    ]
+    lengths = np.fromiter((len(value) for value in items), dtype=np.int64, count=len(items))
+
+    exploded = pd.DataFrame(
+        {
+            id_column: np.repeat(df[id_column].to_numpy(), lengths),
+            column: list(chain.from_iterable(items)),
+        },
+        index=np.repeat(df.index.to_numpy(), lengths),
+    )
+    bad_rows = df.loc[is_bad, [id_column, column]]
+    if len(bad_rows):
+        print(
+            f"Could not parse {column} for {len(bad_rows)} row(s):",
+            ", ".join(bad_rows[id_column].astype(str).head(10)),
+        )
+    return exploded, bad_rows
+
+
+IAP_RANGE_PATTERN = re.compile(r"([^\d]+)(\d+[\.,]?\d*) - ([^\d]+)(\d+[\.,]?\d*)")
+IAP_RANGE_COLUMNS = ["CurrencySymbolMin", "IAPMin", "CurrencySymbolMax", "IAPMax"]
+
+
+# Parse IAP ranges such as "$1.99 - $79.99 per item" straight into float
+# bounds and categorical currency symbols, without building string Series
+# for the intermediate regex groups. Rows without a range stay NaN.
+def parse_iap_ranges(iap_ranges):
+    size = len(iap_ranges)
+    iap_min = np.full(size, np.nan)
+    iap_max = np.full(size, np.nan)
+    symbol_min = [None] * size
+    symbol_max = [None] * size
+
+    for position, value in enumerate(iap_ranges.to_numpy(dtype=object)):
+        match = IAP_RANGE_PATTERN.search(value) if isinstance(value, str) else None
+        if match is None:
+            continue
+        symbol_min[position] = match.group(1).strip()
+        iap_min[position] = float(match.group(2).replace(",", "."))
+        symbol_max[position] = match.group(3).strip()
+        iap_max[position] = float(match.group(4).replace(",", "."))
+
+    return pd.DataFrame(
+        {
+            "CurrencySymbolMin": pd.Categorical(symbol_min),
+            "IAPMin": iap_min,
+            "CurrencySymbolMax": pd.Categorical(symbol_max),
+            "IAPMax": iap_max,
+        },
+        index=iap_ranges.index,
+    )
+
+
+# Keep only the top_k most frequent terms that occur at least min_frequency
+# times. top_k=None keeps every term, which is the unbounded default.
+def limit_term_frequencies(freqs, top_k=None, min_frequency=1):
+    items = freqs.most_common(top_k) if top_k is not None else list(freqs.items())
+    return [(term, count) for term, count in items if count >= min_frequency]
+
+
+# argparse types of the term frequency options
+def positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected an integer, got {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def error_rate(value):
+    try:
+        rate = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number, got {value!r}")
+    if not 0 < rate < 1:
+        raise argparse.ArgumentTypeError(f"must be between 0 and 1 (exclusive), got {rate}")
+    return rate
+
+
+# Corpus-wide heavy hitters with bounded memory (Misra-Gries summary).
+# At most `capacity` counters are kept. Whenever the summary grows past that,
+# the (capacity + 1)-th largest count is subtracted from every counter and
+# added to `error`. A reported frequency therefore underestimates the true
+# frequency by at most `error`, which never exceeds total / (capacity + 1),
+# and every term more frequent than that is guaranteed to be kept.
+# Summaries are mergeable, so partial runs can be combined.
+class HeavyHitters:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counters = Counter()
+        self.total = 0
+        self.error = 0
+
+    @classmethod
+    def from_error_rate(cls, error_rate):
+        return cls(max(1, math.ceil(1 / error_rate) - 1))
+
+    def update(self, counts):
+        self.counters.update(counts)
+        self.total += sum(counts.values())
+        self.prune()
+
+    def merge(self, other):
+        self.counters.update(other.counters)
+        self.total += other.total
+        self.error += other.error
+        self.prune()
+
+    def prune(self):
+        if len(self.counters) <= self.capacity:
+            return
+        counts = np.fromiter(self.counters.values(), dtype=np.int64, count=len(self.counters))
+        threshold = int(np.partition(counts, -(self.capacity + 1))[-(self.capacity + 1)])
+        self.error += threshold
+        self.counters = Counter(
+            {term: count - threshold for term, count in self.counters.items() if count > threshold}
+        )
+
+    def to_frame(self, min_frequency=1):
+        rows = [
+            (term, count, count + self.error)
+            for term, count in self.counters.most_common()
+            if count + self.error >= min_frequency
+        ]
+        return pd.DataFrame(rows, columns=["term", "frequency", "max_frequency"])
+
+
+# Write the corpus-wide word and bigram heavy hitters to one CSV file
+def save_heavy_hitters(word_hitters, bigram_hitters, output_file, outputs, min_frequency=1):
+    heavy_hitters = pd.concat(
+        [
+            word_hitters.to_frame(min_frequency).assign(type="word"),
+            bigram_hitters.to_frame(min_frequency).assign(type="bigram"),
+        ],
+        ignore_index=True,
+    )
+    heavy_hitters = heavy_hitters[["type", "term", "frequency", "max_frequency"]]
+    outputs.add(heavy_hitters, output_file)
+    print(
+        f"Heavy hitters added to {output_file} "
+        f"(word error <= {word_hitters.error}, bigram error <= {bigram_hitters.error})"
+    )
+
+
+# Create a store table for the first run that writes it and add columns that
+# appeared since it was created, so runs with a newer output schema can still
+# be appended. Both steps tolerate a concurrent run doing the same.
+def prepare_store_table(connection, table_name, table):
+    schema = pd.io.sql.get_schema(table, table_name, con=connection)
+    connection.execute(schema.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+    existing = {row[1] for row in connection.execute(f'PRAGMA table_info("{table_name}")')}
+    for column in table.columns:
+        if column in existing:
+            continue
+        try:
+            connection.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{column}"')
+        except sqlite3.OperationalError as e:
+            if "duplicate column" not in str(e):
+                raise
+    connection.commit()
+
+
+# Runs that are still incomplete after this long died before they were
+# recorded; their rows are removed by the next append
+INCOMPLETE_RUN_MAX_AGE = timedelta(days=1)
+
+
+# Delete the runs (and their rows in every store table) that started before
+# `cutoff` and were never completed
+def purge_incomplete_runs(connection, cutoff):
+    run_ids = [
+        row[0]
+        for row in connection.execute(
+            "SELECT run_id FROM runs WHERE complete = 0 AND scraped_at < ?",
+            (cutoff.isoformat(timespec="seconds"),),
+        )
+    ]
+    if not run_ids:
+        return
+    placeholders = ", ".join("?" * len(run_ids))
+    table_names = [
+        row[0]
+        for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name != 'runs'"
+        )
+    ]
+    for table_name in table_names:
+        connection.execute(
+            f'DELETE FROM "{table_name}" WHERE run_id IN ({placeholders})', run_ids
+        )
+    connection.execute(f"DELETE FROM runs WHERE run_id IN ({placeholders})", run_ids)
+    connection.commit()
+    print(f"Removed {len(run_ids)} abandoned incomplete run(s) from the store")
+
+
+# Append the output tables of one run to the local SQLite analytics store.
+# Every row gets the run_id of the run; the runs table records which store was
+# scraped and when. The runs row is inserted first, which hands out a unique
+# run_id even to transforms that append at the same time, and only flagged
+# complete once every table is written: queries only read complete runs, so
+# they never see a run that was partially appended (or died half-way).
+# replaces_run is a run of the same scrape that this one supersedes (the
+# sampled run of a --time-budget transform): the new run takes over its
+# scraped_at, and the old run is deleted in the same transaction that flags
+# the new one complete, so the scrape is never counted twice.
+def append_run_to_store(store_path, store_name, tables, replaces_run=None):
+    started_at = datetime.now(timezone.utc)
+    scraped_at = started_at.isoformat(timespec="seconds")
+    with closing(sqlite3.connect(store_path, timeout=60)) as connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, store TEXT NOT NULL, "
+            "scraped_at TEXT NOT NULL, complete INTEGER NOT NULL DEFAULT 1)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_runs_store_scraped_at ON runs (store, scraped_at)"
+        )
+        # Stores created before runs had a complete flag only hold complete runs
+        if "complete" not in {row[1] for row in connection.execute("PRAGMA table_info(runs)")}:
+            try:
+                connection.execute(
+                    "ALTER TABLE runs ADD COLUMN complete INTEGER NOT NULL DEFAULT 1"
+                )
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):
+                    raise
+        purge_incomplete_runs(connection, started_at - INCOMPLETE_RUN_MAX_AGE)
+        if replaces_run is not None:
+            replaced = connection.execute(
+                "SELECT scraped_at FROM runs WHERE run_id = ? AND store = ?",
+                (replaces_run, store_name),
+            ).fetchone()
+            if replaced is None:
+                print(f"Run {replaces_run} to replace not found in {store_path}, appending")
+                replaces_run = None
+            else:
+                replaced_scraped_at = replaced[0]
+        # Until it is complete a run keeps the time it started, which the purge
+        # of abandoned runs goes by
+        run_id = connection.execute(
+            "INSERT INTO runs (store, scraped_at, complete) VALUES (?, ?, 0)",
+            (store_name, scraped_at),
+        ).lastrowid
+        connection.commit()
+
+        for table_name, table in tables.items():
+            table = table.copy()
+            table.insert(0, "run_id", run_id)
+            prepare_store_table(connection, table_name, table)
+            table.to_sql(table_name, connection, if_exists="append", index=False)
+            if "appId" in table.columns:
+                connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS "idx_{table_name}_appId_run_id" '
+                    f'ON "{table_name}" (appId, run_id)'
+                )
+
+        connection.execute("UPDATE runs SET complete = 1 WHERE run_id = ?", (run_id,))
+        if replaces_run is not None:
+            connection.execute(
+                "UPDATE runs SET scraped_at = ? WHERE run_id = ?", (replaced_scraped_at, run_id)
+            )
+            connection.execute("DELETE FROM runs WHERE run_id = ?", (replaces_run,))
+            for table_name in tables:
+                connection.execute(f'DELETE FROM "{table_name}" WHERE run_id = ?', (replaces_run,))
+        connection.commit()
+    if replaces_run is not None:
+        print(f"Run {run_id} replaced run {replaces_run} in {store_path}")
+    else:
+        print(f"Run {run_id} appended to {store_path}")
+    return run_id
+
+
+# argparse type of --filter COLUMN=VALUE
+def parse_store_filter(value):
+    column, separator, filter_value = value.partition("=")
+    if not separator or not column:
+        raise argparse.ArgumentTypeError(f"expected COLUMN=VALUE, got {value!r}")
+    return column, filter_value
+
+
+# Time series of one app from a table of the analytics store, oldest run first.
+# `filters` narrows rows by column value (e.g. {"word": "crash"}), `last_runs`
+# keeps only the most recent runs written to the table and `since` is an ISO
+# date or timestamp.
+def query_app_history(
+    store_path, table_name, app_id, columns=None, filters=None, last_runs=None, since=None
+):
+    selected = ", ".join(f't."{column}"' for column in columns) if columns else "t.*"
+    sql = (
+        f'SELECT r.scraped_at, {selected} FROM "{table_name}" t '
+        "JOIN runs r ON r.run_id = t.run_id WHERE t.appId = ? AND r.complete = 1"
+    )
+    params = [app_id]
+    for column, value in (filters or {}).items():
+        sql += f' AND t."{column}" = ?'
+        params.append(value)
+    if since is not None:
+        sql += " AND r.scraped_at >= ?"
+        params.append(since)
+    if last_runs is not None:
+        sql += (
+            " AND t.run_id IN (SELECT run_id FROM runs WHERE complete = 1 AND run_id IN "
+            f'(SELECT DISTINCT run_id FROM "{table_name}") '
+            "ORDER BY scraped_at DESC, run_id DESC LIMIT ?)"
+        )
+        params.append(last_runs)
+    sql += " ORDER BY r.scraped_at, r.run_id, t.rowid"
+
+    with closing(sqlite3.connect(store_path)) as connection:
+        history = pd.read_sql_query(sql, connection, params=params)
+    return history
+
+
+# Group rows that carry the same reviews for the same app, e.g. one app scraped
+# from several countries or returned by overlapping queries. Rows are grouped
+# by appId (and country, when present) plus a content hash of the review text.
+# Returns the positions of one representative row per group and, for every
+# row, the number of the group it belongs to.
+def group_duplicate_reviews(df, text_column="reviews"):
+    review_hashes = pd.util.hash_pandas_object(df[text_column], index=False)
+    keys = pd.DataFrame({"appId": df["appId"].to_numpy(), "review_hash": review_hashes.to_numpy()})
+    if "country" in df.columns:
+        keys["country"] = df["country"].to_numpy()
+    row_groups = keys.groupby(list(keys.columns), sort=False, dropna=False).ngroup().to_numpy()
+    _, unique_positions = np.unique(row_groups, return_index=True)
+
+    saved = len(df) - len(unique_positions)
+    print(
+        f"Deduplicated reviews: {len(unique_positions)} unique of {len(df)} rows, "
+        f"{saved} text pipeline runs saved ({saved / max(len(df), 1):.0%})"
+    )
+    return unique_positions, row_groups
+
+
+# Run an expensive text stage (a function from column to column) only on the
+# representative rows and fan the results back out to every row of the group
+def run_once_per_review(column, stage, review_groups):
+    unique_positions, row_groups = review_groups
+    results = stage(column.iloc[unique_positions])
+    return pd.Series(results.to_numpy()[row_groups], index=column.index, name=column.name)
+
+
+PRICE_QUANTILES = [0.25, 0.50, 0.75]
+ENGAGEMENT_QUANTILES = [0.25, 0.5, 0.75, 0.9]
+
+
+# Define price categories based on percentiles
+def price_category(price, percentiles):
+    if price == 0:
+        return 'Free'
+    elif price <= percentiles[0.25]:
+        return 'Low'
+    elif price <= percentiles[0.50]:
+        return 'Medium'
+    elif price <= percentiles[0.75]:
+        return 'High'
+    else:
+        return 'Very High'
+
+
+## Engagement score categorization
+def categorize_engagement_score(score, percentiles):
+    if score >= percentiles[0.9]:
+        return "Very High Engagement"
+    elif score >= percentiles[0.75]:
+        return "High Engagement"
+    elif score >= percentiles[0.5]:
+        return "Moderate Engagement"
+    elif score >= percentiles[0.25]:
+        return "Low Engagement"
+    else:
+        return "Very Low Engagement"
+
+
+# Output tables of each transform. Partial (sharded) outputs are merged in
+# input order; device support rows come out of melt grouped by device, so
+# they are ordered by device first.
+APP_STORE_OUTPUTS = [
+    "AppStoreOutput_cleaned.csv",
+    "AppStore_Languages.csv",
+    "AppStore_Genres.csv",
+    "AppStore_Bigrams.csv",
+    "AppStore_Word_Frequencies.csv",
+    "AppStore_Device_Support.csv",
+]
+GOOGLE_PLAY_OUTPUTS = [
+    "GooglePlayOutput_cleaned.csv",
+    "GooglePlay_Categories.csv",
+    "GooglePlay_Bigrams.csv",
+    "GooglePlay_Word_Frequencies.csv",
+]
+DEVICE_ORDER = ["supports_iPhone", "supports_iPad", "supports_Mac"]
+SHARD_ROW_COLUMN = "input_row"
+
+
+# Parse a "--shard i/N" argument; shards are numbered from 0 to N - 1
+def parse_shard(value):
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {value!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 0 and {count - 1}")
+    return index, count
+
+
+# Shard of every appId. crc32 is used instead of hash() because it is stable
+# across processes and machines, so each app always lands in the same shard.
+def shard_of(app_ids, count):
+    return np.array([zlib.crc32(str(app_id).encode("utf-8")) % count for app_id in app_ids])
+
+
+# Identifier of a sharded run. Every shard and the merge read the same scraped
+# input, so by default its content identifies the run: partial files left over
+# from a run on another input are never merged.
+def shard_run_id(input_fingerprint, run_id=None):
+    return run_id or input_fingerprint[:12]
+
+
+def shard_file_name(file_name, shard):
+    index, count, run_id = shard
+    stem, extension = os.path.splitext(file_name)
+    return f"{stem}.shard-{run_id}-{index}-of-{count}{extension}"
+
+
+# Write one output table. Sharded runs keep the input row number of every row,
+# which the merge uses to restore the order of a single-process run.
+def save_output(table, path, shard=None, **kwargs):
+    if shard is None:
+        table.to_csv(path, index=False, **kwargs)
+    else:
+        table.to_csv(path, index_label=SHARD_ROW_COLUMN, **kwargs)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as output:
+        for chunk in iter(lambda: output.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Published runs kept next to --output-dir besides the current one, so readers
+# that resolved the link before a publish can finish reading
+KEEP_PREVIOUS_RUNS = 2
+
+
+# Collects the output tables of a run and writes them together, concurrently.
+# Without an output directory every table is written to the working directory
+# as before, each through a temporary file that is renamed into place, so no
+# file is ever half-written. With an output directory the whole run (tables,
+# manifest.json and, optionally, one .tar.gz bundle of both) is written into a
+# fresh directory .<name>-xxxxxxxx next to it; output_dir is a symlink that is
+# then swapped to the new directory in one atomic rename, so readers only see
+# complete runs. Only run directories created this way are ever deleted.
+class RunOutputs:
+    def __init__(self, store_name, output_dir=None, shard=None, bundle=False):
+        self.store_name = store_name
+        # Shard partials stay in the working directory, where the merge reads them
+        self.output_dir = output_dir if shard is None else None
+        self.shard = shard
+        self.bundle = bundle
+        self.tables = []
+        # Column dtypes of the tables of a shard, which the merge needs to
+        # write the values exactly as a single run would
+        self.dtypes = []
+
+    def add(self, table, file_name, **kwargs):
+        if self.shard is not None:
+            self.dtypes.extend(
+                (file_name, str(column), str(dtype)) for column, dtype in table.dtypes.items()
+            )
+            file_name = shard_file_name(file_name, self.shard)
+        self.tables.append((table, file_name, kwargs))
+
+    # Where a table of this run can be read once the run has been written
+    def path(self, file_name):
+        return os.path.join(self.output_dir, file_name) if self.output_dir else file_name
+
+    def write_table(self, directory, table, file_name, kwargs):
+        path = os.path.join(directory, file_name)
+        if self.output_dir is None:
+            # No manifest is written, so there is nothing to measure or hash
+            temporary_path = f"{path}.tmp-{os.getpid()}"
+            save_output(table, temporary_path, self.shard, **kwargs)
+            os.replace(temporary_path, path)
+            return None
+        save_output(table, path, self.shard, **kwargs)
+        return {
+            "file": file_name,
+            "rows": len(table),
+            "bytes": os.path.getsize(path),
+            "sha256": file_sha256(path),
+            "schema": [
+                {"name": str(column), "dtype": str(dtype)} for column, dtype in table.dtypes.items()
+            ],
+        }
+
+    def write(self):
+        if self.shard is not None:
+            self.add(
+                pd.DataFrame(self.dtypes, columns=["file", "column", "dtype"]),
+                f"{self.store_name}_Shard_Dtypes.csv",
+            )
+        if self.output_dir is None:
+            self.write_tables(".")
+            return
+
+        self.check_output_dir()
+        parent = os.path.dirname(os.path.abspath(self.output_dir))
+        os.makedirs(parent, exist_ok=True)
+        directory = tempfile.mkdtemp(prefix=f".{os.path.basename(self.output_dir)}-", dir=parent)
+        try:
+            os.chmod(directory, 0o755)
+            self.write_run(directory)
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        self.publish(directory)
+        print(f"Run outputs published to {self.output_dir} ({len(self.tables)} tables)")
+
+    def write_tables(self, directory):
+        workers = min(len(self.tables), os.cpu_count() or 1) or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(
+                executor.map(lambda output: self.write_table(directory, *output), self.tables)
+            )
+
+    def write_run(self, directory):
+        manifest_tables = self.write_tables(directory)
+
+        manifest = {
+            "store": self.store_name,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "shard": list(self.shard) if self.shard is not None else None,
+            "tables": manifest_tables,
+        }
+        with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        if self.bundle:
+            bundle_path = os.path.join(directory, f"{self.store_name}_outputs.tar.gz")
+            with tarfile.open(bundle_path, "w:gz") as bundle:
+                for name in ["manifest.json"] + [table["file"] for table in manifest_tables]:
+                    bundle.add(os.path.join(directory, name), arcname=name)
+
+    # Run directories this class created for output_dir
+    def run_directories(self):
+        parent = os.path.dirname(os.path.abspath(self.output_dir))
+        pattern = re.compile(re.escape(f".{os.path.basename(self.output_dir)}-") + r"[a-z0-9_]{8}$")
+        return [
+            os.path.join(parent, name)
+            for name in os.listdir(parent)
+            if pattern.match(name) and not os.path.islink(os.path.join(parent, name))
+            and os.path.isdir(os.path.join(parent, name))
+        ]
+
+    # output_dir must not exist yet or be a symlink to one of our run
+    # directories; anything else belongs to someone else and is left alone
+    def check_output_dir(self):
+        if not os.path.lexists(self.output_dir):
+            return
+        if os.path.islink(self.output_dir):
+            target = os.path.realpath(self.output_dir)
+            if target in {os.path.realpath(path) for path in self.run_directories()}:
+                return
+        raise FileExistsError(
+            f"{self.output_dir} already exists and was not created by --output-dir; "
+            "choose another output directory or remove it"
+        )
+
+    # Point output_dir at the new run directory with an atomic symlink swap and
+    # remove published runs beyond the KEEP_PREVIOUS_RUNS most recent ones
+    def publish(self, directory):
+        self.check_output_dir()
+        link = f"{self.output_dir}.link-{os.getpid()}"
+        os.symlink(os.path.basename(directory), link)
+        os.replace(link, self.output_dir)
+
+        previous_runs = sorted(
+            (
+                path
+                for path in self.run_directories()
+                if os.path.realpath(path) != os.path.realpath(directory)
+                # Runs still being written by another process have no manifest yet
+                and os.path.exists(os.path.join(path, "manifest.json"))
+            ),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for path in previous_runs[KEEP_PREVIOUS_RUNS:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# Mergeable summary of the columns whose percentiles drive a categorization:
+# the count of every distinct value, which is enough to recompute the exact
+# percentiles of the whole dataset from the shards.
+def save_quantile_summary(df, columns, file_name, outputs):
+    summary = pd.concat(
+        [
+            df[column].value_counts().rename_axis("value").reset_index(name="count").assign(column=column)
+            for column in columns
+        ],
+        ignore_index=True,
+    )
+    outputs.add(summary[["column", "value", "count"]], file_name)
+
+
+def merged_quantiles(summary, column, quantiles):
+    rows = summary[summary["column"] == column]
+    counts = rows["count"].astype(int).groupby(text_to_float(rows["value"])).sum()
+    values = pd.Series(np.repeat(counts.index.to_numpy(), counts.to_numpy()))
+    return values.quantile(quantiles)
+
+
+# Find the partial files of one output written by run run_id; all shards of
+# the run must be present
+def find_shard_files(file_name, run_id):
+    stem, extension = os.path.splitext(file_name)
+    pattern = re.compile(
+        re.escape(stem) + r"\.shard-(.+)-(\d+)-of-(\d+)" + re.escape(extension) + "$"
+    )
+    shards = {}
+    other_runs = set()
+    for candidate in os.listdir("."):
+        match = pattern.match(candidate)
+        if match and match.group(1) == run_id:
+            shards[(int(match.group(2)), int(match.group(3)))] = candidate
+        elif match:
+            other_runs.add(match.group(1))
+    counts = {count for _, count in shards}
+    if len(counts) != 1:
+        raise ValueError(
+            f"Expected the shards of exactly one shard count for {file_name} of run {run_id}, "
+            f"found {sorted(shards)} (other runs present: {sorted(other_runs)})"
+        )
+    count = counts.pop()
+    missing = [index for index in range(count) if (index, count) not in shards]
+    if missing:
+        raise ValueError(f"Missing shards {missing} of {count} for {file_name}")
+    return [shards[(index, count)] for index in range(count)]
+
+
+# Concatenate the partial files of one output in the order of a single run.
+# Values are read as text so they are written back exactly as the shards had
+# them. shard_dtypes holds the column dtypes every shard recorded.
+def merge_shard_files(file_name, run_id, shard_dtypes):
+    paths = find_shard_files(file_name, run_id)
+    partials = [pd.read_csv(path, dtype=str, keep_default_na=False) for path in paths]
+    # A column that is integer in some shards but float in others (e.g. because
+    # only some shards have missing values) is float in a single run, so the
+    # integers are written as floats too. Nullable Int64 columns stay integer.
+    # Shards without rows carry no reliable type information and are left out.
+    for column in partials[0].columns:
+        if column == SHARD_ROW_COLUMN:
+            continue
+        dtypes = [
+            partial_dtypes.get((file_name, column), "object") for partial_dtypes in shard_dtypes
+        ]
+        kinds = {
+            "int" if dtype.startswith("int") else "float" if dtype.startswith("float") else dtype
+            for partial, dtype in zip(partials, dtypes)
+            if len(partial)
+        }
+        if kinds == {"int", "float"}:
+            for partial, dtype in zip(partials, dtypes):
+                if dtype.startswith("int"):
+                    partial[column] = partial[column].map(lambda value: str(float(value)))
+
+    merged = pd.concat(partials, ignore_index=True)
+    merged[SHARD_ROW_COLUMN] = merged[SHARD_ROW_COLUMN].astype(int)
+    sort_keys = [SHARD_ROW_COLUMN]
+    if file_name.endswith("_Device_Support.csv"):
+        merged["Device"] = pd.Categorical(merged["Device"], categories=DEVICE_ORDER, ordered=True)
+        sort_keys = ["Device", SHARD_ROW_COLUMN]
+    merged = merged.sort_values(sort_keys, kind="stable").drop(columns=SHARD_ROW_COLUMN)
+    if "Device" in sort_keys:
+        merged["Device"] = merged["Device"].astype(str)
+    return merged
+
+
+# Parse numbers that were read as text; float() round-trips what to_csv wrote
+def text_to_float(column):
+    return column.replace("", "nan").astype(float)
+
+
+# Merge heavy-hitter summaries of the shards (see HeavyHitters.merge)
+def merge_heavy_hitters(file_name, heavy_hitters_error, outputs, run_id, min_frequency=1):
+    merged = {
+        "word": HeavyHitters.from_error_rate(heavy_hitters_error),
+        "bigram": HeavyHitters.from_error_rate(heavy_hitters_error),
+    }
+    for path in find_shard_files(file_name, run_id):
+        partial = pd.read_csv(path, keep_default_na=False)
+        for kind, rows in partial.groupby("type"):
+            hitters = HeavyHitters(merged[kind].capacity)
+            hitters.counters = Counter(dict(zip(rows["term"], rows["frequency"])))
+            hitters.error = int((rows["max_frequency"] - rows["frequency"]).max())
+            merged[kind].merge(hitters)
+    save_heavy_hitters(merged["word"], merged["bigram"], file_name, outputs, min_frequency)
+
+
+# Combine the partial outputs of a sharded transform into the final outputs.
+# The percentile-based categories are recomputed from the merged quantile
+# summaries, so the result matches a single-process run.
+def merge_shards(
+    store_name,
+    heavy_hitters_error=None,
+    min_frequency=1,
+    store=None,
+    output_dir=None,
+    bundle=False,
+    run_id=None,
+    keep_shards=False,
+):
+    run_id = shard_run_id(file_sha256(f"./{store_name}Output.csv"), run_id)
+    output_files = APP_STORE_OUTPUTS if store_name == "AppStore" else GOOGLE_PLAY_OUTPUTS
+    cleaned_file = output_files[0]
+    shard_dtypes = [
+        {
+            (row.file, row.column): row.dtype
+            for row in pd.read_csv(path, dtype=str, keep_default_na=False).itertuples()
+        }
+        for path in find_shard_files(f"{store_name}_Shard_Dtypes.csv", run_id)
+    ]
+    tables = {
+        file_name: merge_shard_files(file_name, run_id, shard_dtypes) for file_name in output_files
+    }
+
+    summary_file = f"{store_name}_Quantile_Summary.csv"
+    summary = pd.concat(
+        [
+            pd.read_csv(path, dtype=str, keep_default_na=False)
+            for path in find_shard_files(summary_file, run_id)
+        ],
+        ignore_index=True,
+    )
+    cleaned = tables[cleaned_file]
+    if store_name == "AppStore":
+        percentiles = merged_quantiles(summary, "price", PRICE_QUANTILES)
+        cleaned["price_category"] = text_to_float(cleaned["price"]).apply(
+            lambda price: price_category(price, percentiles)
+        )
+    else:
+        percentiles = merged_quantiles(summary, "engagement_score", ENGAGEMENT_QUANTILES).to_dict()
+        cleaned["engagement_score_category"] = text_to_float(cleaned["engagement_score"]).apply(
+            lambda score: categorize_engagement_score(score, percentiles)
+        )
+
+    outputs = RunOutputs(store_name, output_dir, bundle=bundle)
+    for file_name, table in tables.items():
+        outputs.add(table, file_name)
+        print(f"Merged {file_name} ({len(table)} rows)")
+    if heavy_hitters_error is not None:
+        merge_heavy_hitters(
+            f"{store_name}_Heavy_Hitters.csv", heavy_hitters_error, outputs, run_id, min_frequency
+        )
+    outputs.write()
+
+    # The store gets typed columns, as from a single run, rather than the merged text
+    if store is not None:
+        append_run_to_store(
+            store,
+            store_name,
+            {
+                os.path.splitext(file_name)[0]: pd.read_csv(outputs.path(file_name))
+                for file_name in output_files
+            },
+        )
+    if not keep_shards:
+        remove_shard_files(store_name, run_id)
+
+
+# Delete every partial file of a sharded run of one store once it is merged
+def remove_shard_files(store_name, run_id):
+    pattern = re.compile(
+        re.escape(store_name) + r".*\.shard-" + re.escape(run_id) + r"-\d+-of-\d+\.csv$"
+    )
+    removed = [name for name in os.listdir(".") if pattern.match(name)]
+    for name in removed:
+        os.remove(name)
+    print(f"Removed {len(removed)} shard files of run {run_id}")
+
+
+# server.js joins the reviews of an app into one string with this separator
+REVIEW_SEPARATOR = " | "
+# Reviews of the first batch of apps are used to estimate the text stage costs
+CALIBRATION_BATCH = 8
+# Share of the remaining time budget the text stages may use; the rest is
+# kept for the categorizations and writing the outputs
+BUDGET_SAFETY = 0.8
+
+
+# Costs of the expensive text stages, measured on a small batch of reviews.
+# Stopword removal, word frequencies and bigrams scale with the review text
+# (seconds per character); sentiment runs once per app on text truncated to
+# 512 tokens, so its cost is per call and barely shrinks when reviews are
+# sampled. Returns the per-character costs and the seconds per sentiment call.
+def estimate_text_stage_costs(reviews, keep_unicode=False):
+    characters = max(int(reviews.fillna("").astype(str).str.len().sum()), 1)
+    costs = {}
+
+    started_at = time.perf_counter()
+    processed = preprocess_reviews(reviews, keep_unicode=keep_unicode)
+    costs["stopwords"] = (time.perf_counter() - started_at) / characters
+
+    started_at = time.perf_counter()
+    for text in processed:
+        Counter(text.split())
+        if len(text.split()) >= 2:
+            Counter(" ".join(bigram) for bigram in TextBlob(text).ngrams(2))
+    costs["word frequencies and bigrams"] = (time.perf_counter() - started_at) / characters
+
+    started_at = time.perf_counter()
+    for text in processed:
+        try:
+            get_sentiment_analyzer()(text, truncation=True, max_length=512)
+        except Exception:
+            pass
+    sentiment_cost = (time.perf_counter() - started_at) / max(len(processed), 1)
+    return costs, sentiment_cost
+
+
+# Stratified review sampling: every app is a stratum and keeps the same
+# fraction of its reviews (at least one), spread evenly over its review list.
+# Returns the sampled reviews and the sample size of every app whose reviews
+# were cut (NA where all reviews were kept).
+def sample_reviews(reviews, fraction):
+    sampled = []
+    sample_sizes = []
+    for text in reviews.to_numpy(dtype=object):
+        if not isinstance(text, str):
+            sampled.append(text)
+            sample_sizes.append(pd.NA)
+            continue
+        parts = text.split(REVIEW_SEPARATOR)
+        keep = max(1, math.ceil(fraction * len(parts)))
+        if keep >= len(parts):
+            sampled.append(text)
+            sample_sizes.append(pd.NA)
+            continue
+        positions = np.linspace(0, len(parts) - 1, keep).round().astype(int)
+        sampled.append(REVIEW_SEPARATOR.join(parts[position] for position in positions))
+        sample_sizes.append(keep)
+    return (
+        pd.Series(sampled, index=reviews.index, name=reviews.name),
+        pd.Series(sample_sizes, index=reviews.index, dtype="Int64"),
+    )
+
+
+# Decide whether the text stages fit in the time budget. The stage costs are
+# estimated on the first batch of unique reviews; if the predicted time does
+# not fit in what is left of the budget, the reviews of every app are sampled
+# down to the fraction that does. Sentiment costs the same per app whatever the
+# fraction, so only the time left after it is shared by the per-character
+# stages. Returns the fraction of reviews kept.
+def apply_time_budget(df, review_groups, time_budget, started_at, keep_unicode=False):
+    unique_positions, _ = review_groups
+    representatives = df["reviews"].iloc[unique_positions]
+    costs, sentiment_cost = estimate_text_stage_costs(
+        representatives.iloc[:CALIBRATION_BATCH], keep_unicode
+    )
+    characters = int(representatives.fillna("").astype(str).str.len().sum())
+    stage_times = {stage: cost * characters for stage, cost in costs.items()}
+    stage_times["sentiment"] = sentiment_cost * len(representatives)
+    scaled_time = sum(stage_times.values()) - stage_times["sentiment"]
+    seconds_left = (time_budget - (time.perf_counter() - started_at)) * BUDGET_SAFETY
+
+    print(
+        "Estimated text stage time: "
+        + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in stage_times.items())
+        + f" ({seconds_left:.1f}s of the budget left)"
+    )
+    df["review_sample_size"] = pd.Series(pd.NA, index=df.index, dtype="Int64")
+    if sum(stage_times.values()) <= seconds_left:
+        return 1.0
+
+    fraction = max(seconds_left - stage_times["sentiment"], 0) / max(scaled_time, 1e-9)
+    df["reviews"], df["review_sample_size"] = sample_reviews(df["reviews"], fraction)
+    print(
+        f"Time budget at risk, sampling {fraction:.0%} of the reviews of "
+        f"{int(df['review_sample_size'].notna().sum())} apps"
+    )
+    if fraction == 0:
+        print(
+            "Warning: the time budget cannot be met even with one review per app "
+            f"(sentiment alone is estimated at {stage_times['sentiment']:.1f}s, "
+            f"{seconds_left:.1f}s left)"
+        )
+    return fraction
+
+
+# Compare the time a budgeted transform took with its budget
+def report_time_budget(time_budget, started_at):
+    elapsed = time.perf_counter() - started_at
+    if elapsed <= time_budget:
+        print(f"Finished in {elapsed:.1f}s of the {time_budget:.1f}s time budget")
+    else:
+        print(f"Warning: took {elapsed:.1f}s, over the {time_budget:.1f}s time budget")
+
+
+# Output of the detached full-fidelity passes
+FULL_PASS_LOG = "transform_full_pass.log"
+
+
+# Read the scraped input once: the bytes are parsed, fingerprinted and, when a
+# full-fidelity pass follows, snapshotted, so all three describe the same scrape
+# even if server.js overwrites the file meanwhile
+def read_input(input_path):
+    with open(input_path, "rb") as input_file:
+        input_bytes = input_file.read()
+    return input_bytes, hashlib.sha256(input_bytes).hexdigest()
+
+
+# Input of a transform: the scraped file, or for a full-fidelity pass the
+# snapshot of the scrape it was started for
+def read_transform_input(input_path, source_fingerprint=None):
+    if source_fingerprint is not None:
+        input_path = input_snapshot_path(input_path, source_fingerprint)
+    input_bytes, input_fingerprint = read_input(input_path)
+    if source_fingerprint is not None and input_fingerprint != source_fingerprint:
+        raise ValueError(f"{input_path} does not match fingerprint {source_fingerprint}")
+    return input_path, input_bytes, input_fingerprint
+
+
+# Where the input of a sampled run is kept for its full-fidelity pass
+def input_snapshot_path(input_path, fingerprint):
+    directory, name = os.path.split(input_path)
+    stem, extension = os.path.splitext(name)
+    return os.path.join(directory, f".{stem}.{fingerprint[:16]}{extension}")
+
+
+def write_input_snapshot(input_bytes, input_path, fingerprint):
+    snapshot_path = input_snapshot_path(input_path, fingerprint)
+    temporary_path = f"{snapshot_path}.tmp-{os.getpid()}"
+    with open(temporary_path, "wb") as snapshot:
+        snapshot.write(input_bytes)
+    os.replace(temporary_path, snapshot_path)
+
+
+# A full-fidelity pass must not overwrite the outputs of a newer scrape: true
+# when the live input no longer is the scrape the pass was started for
+def input_superseded(input_path, source_fingerprint):
+    if source_fingerprint is None or read_input(input_path)[1] == source_fingerprint:
+        return False
+    print(f"{input_path} now holds a newer scrape, its outputs are left in place")
+    return True
+
+
+# Re-run the same command without --time-budget as a detached process, so the
+# full-fidelity outputs replace the sampled ones once they are ready. The pass
+# reads the snapshot of the sampled run's input (source_fingerprint), run_id
+# is the sampled run in the analytics store that it replaces, and its output
+# is appended to FULL_PASS_LOG.
+def start_full_fidelity_pass(argv, run_id, source_fingerprint):
+    command = []
+    arguments = iter(argv)
+    for argument in arguments:
+        if argument in ("--time-budget", "--replace-run", "--source-fingerprint"):
+            next(arguments, None)
+        elif not argument.startswith(
+            ("--time-budget=", "--replace-run=", "--source-fingerprint=")
+        ):
+            command.append(argument)
+    if run_id is not None:
+        command += ["--replace-run", str(run_id)]
+    command += ["--source-fingerprint", source_fingerprint]
+    with open(FULL_PASS_LOG, "a") as log:
+        process = subprocess.Popen(
+            [sys.executable] + command,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+    print(
+        f"Full-fidelity transform running in the background (pid {process.pid}, "
+        f"log in {FULL_PASS_LOG})"
+    )
 
-    df = pd.read_csv('./AppStoreOutput.csv', delimiter=',', encoding='utf-8')
-    df['released'] = pd.to_datetime(df['released'])
-    df['updated'] = pd.to_datetime(df['updated'])
+
+# Hashed term vectors for the similar-app index: terms are mapped to a fixed
+# number of columns with crc32, so the index never needs a vocabulary
+SIMILARITY_DIMENSIONS = 2 ** 18
+# Words of two or more letters, in any script: a letter followed by letters or
+# combining marks, so that e.g. Hindi vowel signs stay part of the word
+TOKEN_PATTERN = re.compile(f"[^\\W\\d_](?:[^\\W\\d_]|[{unicode_category_class('M')}])+")
+
+
+# Hashed term counts of one app: description words (without English
+# stopwords), the already processed review words and the genres/categories
+def similarity_term_counts(description, processed_reviews, labels, stop_words):
+    terms = [
+        word
+        for word in TOKEN_PATTERN.findall(description.lower() if isinstance(description, str) else "")
+        if word not in stop_words
+    ]
+    if isinstance(processed_reviews, str):
+        terms.extend(processed_reviews.split())
+    if isinstance(labels, list):
+        terms.extend(f"label:{label}" for label in labels)
+    return Counter(zlib.crc32(term.encode("utf-8")) % SIMILARITY_DIMENSIONS for term in terms)
+
+
+def load_similarity_index(index_path):
+    with np.load(index_path, allow_pickle=False) as index:
+        return {key: index[key] for key in index.files}
+
+
+# Add or replace the apps of this run in the similar-app index. The index keeps
+# raw term counts in CSR form (indptr/indices/counts) next to the store, appId
+# and title of every app; TF-IDF weights are derived from the counts at query
+# time, so updating a few apps never requires reweighting the others. The file
+# is written to a per-process temporary path and renamed into place; the
+# read-modify-write holds an exclusive lock on <index>.lock, so transforms of
+# both stores can update the same index at the same time.
+def update_similarity_index(index_path, store_name, apps):
+    stop_words = set(get_stopwords_index("english"))
+    apps = apps.drop_duplicates("appId")
+    rows = [
+        similarity_term_counts(description, processed_reviews, labels, stop_words)
+        for description, processed_reviews, labels in zip(
+            apps["description"], apps["processed_reviews"], apps["labels"]
+        )
+    ]
+
+    stores = [store_name] * len(apps)
+    app_ids = apps["appId"].astype(str).tolist()
+    titles = apps["title"].fillna("").astype(str).tolist()
+    with open(f"{index_path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(index_path):
+            index = load_similarity_index(index_path)
+            replaced = set(app_ids)
+            for position, (store, app_id) in enumerate(zip(index["stores"], index["app_ids"])):
+                if store == store_name and app_id in replaced:
+                    continue
+                start, end = index["indptr"][position], index["indptr"][position + 1]
+                rows.append(Counter(dict(zip(index["indices"][start:end].tolist(), index["counts"][start:end].tolist()))))
+                stores.append(str(store))
+                app_ids.append(str(app_id))
+                titles.append(str(index["titles"][position]))
+
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        indices = np.fromiter(chain.from_iterable(row.keys() for row in rows), dtype=np.int32, count=int(indptr[-1]))
+        counts = np.fromiter(chain.from_iterable(row.values() for row in rows), dtype=np.float32, count=int(indptr[-1]))
+
+        temporary_path = f"{index_path}.tmp-{os.getpid()}"
+        with open(temporary_path, "wb") as index_file:
+            np.savez_compressed(
+                index_file,
+                stores=np.array(stores, dtype=str),
+                app_ids=np.array(app_ids, dtype=str),
+                titles=np.array(titles, dtype=str),
+                indptr=indptr,
+                indices=indices,
+                counts=counts,
+            )
+        os.replace(temporary_path, index_path)
+    print(f"Similarity index {index_path} updated ({len(apps)} apps from this run, {len(app_ids)} in total)")
+
+
+# L2-normalized TF-IDF weights (sublinear tf, smoothed idf) of every stored count
+def similarity_weights(index):
+    indptr, indices, counts = index["indptr"], index["indices"], index["counts"]
+    app_count = len(indptr) - 1
+    document_frequency = np.bincount(indices, minlength=SIMILARITY_DIMENSIONS)
+    idf = np.log((1 + app_count) / (1 + document_frequency)) + 1
+    weights = (1 + np.log(counts)) * idf[indices]
+    norms = np.sqrt(np.add.reduceat(np.append(weights ** 2, 0), indptr[:-1]))
+    norms[indptr[:-1] == indptr[1:]] = 1
+    return weights / np.repeat(norms, np.diff(indptr))
+
+
+# Apps most similar to app_id by cosine similarity of their TF-IDF vectors.
+# Exact search over the whole index: the query vector is scattered into a
+# dense array and every app is scored in one vectorized pass over the CSR data.
+# An appId indexed under both stores (shared bundle ids) is queried with the
+# copy of store_name, or the first one, and neither copy is returned.
+def query_similar_apps(index_path, app_id, top=10, store_name=None):
+    index = load_similarity_index(index_path)
+    matches = np.flatnonzero(index["app_ids"] == app_id)
+    if store_name is not None:
+        matches = matches[index["stores"][matches] == store_name]
+    if not len(matches):
+        raise KeyError(f"{app_id} is not in the similarity index {index_path}")
+    position = matches[0]
+
+    indptr, indices = index["indptr"], index["indices"]
+    weights = similarity_weights(index)
+    query = np.zeros(SIMILARITY_DIMENSIONS)
+    start, end = indptr[position], indptr[position + 1]
+    query[indices[start:end]] = weights[start:end]
+
+    scores = np.add.reduceat(np.append(weights * query[indices], 0), indptr[:-1])
+    scores[indptr[:-1] == indptr[1:]] = 0
+    scores[index["app_ids"] == app_id] = -np.inf
+    nearest = np.argsort(-scores, kind="stable")[:top]
+    nearest = nearest[np.isfinite(scores[nearest])]
+    return pd.DataFrame(
+        {
+            "store": index["stores"][nearest],
+            "appId": index["app_ids"][nearest],
+            "title": index["titles"][nearest],
+            "similarity": scores[nearest],
+        }
+    )
+
+
+# Example transformation function
+def transform_AppStoreData(
+    input_file,
+    output_file,
+    keep_unicode=False,
+    top_k=None,
+    min_frequency=1,
+    heavy_hitters_error=None,
+    store=None,
+    shard=None,
+    time_budget=None,
+    similarity_index=None,
+    output_dir=None,
+    bundle=False,
+    run_id=None,
+    replace_run=None,
+    source_fingerprint=None,
+):
+    # Loaded before the clock starts, it is not part of a --time-budget
+    sentiment_analyzer = get_sentiment_analyzer()
+    started_at = time.perf_counter()
+
+    input_path, input_bytes, input_fingerprint = read_transform_input(
+        './AppStoreOutput.csv', source_fingerprint
+    )
+    if shard is not None:
+        shard = (*shard, shard_run_id(input_fingerprint, run_id))
+    outputs = RunOutputs('AppStore', output_dir, shard, bundle)
+    df = pd.read_csv(io.BytesIO(input_bytes), delimiter=',', encoding='utf-8')
+    if shard is not None:
+        df = df[shard_of(df['appId'], shard[1]) == shard[0]]
+    df['released'] = pd.to_datetime(df['released'], utc=True)
+    df['updated'] = pd.to_datetime(df['updated'], utc=True)
     df['score'] = pd.to_numeric(df['score'], errors='coerce')
     df['free'] = df['free'].astype(int)
     df['supports_iPhone'] = 0
@@ -48,85 +1405,39 @@ def transform_AppStoreData(input_file, output_file):
     df['app_age'] = (df['updated'] - df['released']).dt.days
     df['reviews'] = df['reviews'].astype(str)
 
-    # Mapping from language names to NLTK compatible language codes
-    nltk_lang_map = {
-        'ar': 'arabic',
-        'az': 'azerbaijani',
-        'eu': 'basque',
-        'bn': 'bengali',
-        'ca': 'catalan',
-        'zh': 'chinese',
-        'da': 'danish',
-        'nl': 'dutch',
-        'en': 'english',
-        'fi': 'finnish',
-        'fr': 'french',
-        'de': 'german',
-        'el': 'greek',
-        'he': 'hebrew',
-        'hu': 'hungarian',
-        'id': 'indonesian',
-        'it': 'italian',
-        'kk': None,  # No support in NLTK
-        'ne': None,  # No support in NLTK
-        'no': 'norwegian',
-        'pt': 'portuguese',
-        'ro': 'romanian',
-        'ru': 'russian',
-        'sl': 'slovene',
-        'es': 'spanish',
-        'sv': 'swedish',
-        'tg': None,  # No support in NLTK
-        'tr': 'turkish'
-    }
+    # Text stages run once per unique (appId, review) and are fanned out to duplicates
+    review_groups = group_duplicate_reviews(df)
 
-    def get_stopwords(text):
-        try:
-            # Detect the language of the text
-            lang = detect(text)
-            # Get the stopwords for the detected language
-            stopwords_lang = nltk_lang_map.get(lang, 'english')
-            if stopwords_lang:
-                return set(stopwords.words(stopwords_lang))
-            else:
-                return set(stopwords.words('english'))
-        except Exception as e:
-            print("Error in detecting language or loading stopwords:", e)
-            return set(stopwords.words('english'))
-
-    def preprocess_and_split_reviews(reviews):
-        # Convert reviews to string to avoid TypeError with non-string inputs
-        if pd.isna(reviews):
-            return ""  # Return an empty string if the review is NaN
-        reviews = str(reviews)
-        try:
-            # Use language-specific stopwords
-            stop_words = get_stopwords(reviews)
-        except Exception as e:
-            print("Error using language-specific stopwords:", e)
-            stop_words = set(stopwords.words('english'))  # Default to English if error occurs
-
-        # Remove all non-alpha characters and extra spaces, convert to lower case
-        reviews = re.sub('\\s+', ' ', reviews).strip().lower()
-        reviews = re.sub(r'[^\u0000-\u007F]+', '', reviews)
+    # Sample reviews per app when the text stages would not fit in the time budget
+    review_fraction = 1.0
+    if time_budget is not None:
+        review_fraction = apply_time_budget(df, review_groups, time_budget, started_at, keep_unicode)
 
-        # Remove stopwords
-        words = [word for word in reviews.split() if word not in stop_words and len(word) > 1]
-        return ' '.join(words)
+    # Normalize reviews and remove language-specific stopwords
+    df['processed_reviews'] = run_once_per_review(
+        df['reviews'], lambda reviews: preprocess_reviews(reviews, keep_unicode=keep_unicode), review_groups
+    )
 
-    # Apply the modified function to your DataFrame
-    df['processed_reviews'] = df['reviews'].apply(preprocess_and_split_reviews)
+    # Optional bounded summaries of the corpus-wide most frequent terms
+    word_hitters = bigram_hitters = None
+    if heavy_hitters_error is not None:
+        word_hitters = HeavyHitters.from_error_rate(heavy_hitters_error)
+        bigram_hitters = HeavyHitters.from_error_rate(heavy_hitters_error)
 
-        # Function to get and flatten bigrams with their frequencies
+    # Function to get and flatten bigrams with their frequencies
     def get_and_flatten_bigrams(text):
         if len(text.split()) < 2:
             return []
         blob = TextBlob(text)
-        bigrams = [' '.join(bigram) for bigram in blob.ngrams(2)]
-        return list(Counter(bigrams).items())
+        bigrams = Counter(' '.join(bigram) for bigram in blob.ngrams(2))
+        if bigram_hitters is not None:
+            bigram_hitters.update(bigrams)
+        return limit_term_frequencies(bigrams, top_k, min_frequency)
 
     # Assuming 'processed_reviews' column is already in the dataframe 'df'
-    df['bigrams'] = df['processed_reviews'].apply(get_and_flatten_bigrams)
+    df['bigrams'] = run_once_per_review(
+        df['processed_reviews'], lambda texts: texts.apply(get_and_flatten_bigrams), review_groups
+    )
 
     # Explode the bigrams into separate rows, including their frequencies
     bigrams_rows = df.explode('bigrams')
@@ -138,9 +1449,13 @@ def transform_AppStoreData(input_file, output_file):
 
     def flatten_word_frequencies(text):
         freqs = Counter(text.split())
-        return list(freqs.items())
+        if word_hitters is not None:
+            word_hitters.update(freqs)
+        return limit_term_frequencies(freqs, top_k, min_frequency)
 
-    df['word_freq'] = df['processed_reviews'].apply(flatten_word_frequencies)
+    df['word_freq'] = run_once_per_review(
+        df['processed_reviews'], lambda texts: texts.apply(flatten_word_frequencies), review_groups
+    )
     word_freq_rows = df.explode('word_freq')
     word_freq_df = pd.DataFrame({
         'appId': word_freq_rows['appId'],
@@ -180,21 +1495,11 @@ def transform_AppStoreData(input_file, output_file):
             print(f"Error processing text: {e}")
             return 'Missing'  # Default to 'Missing' in case of an error
 
-    df['Sentiment_Category'] = df['processed_reviews'].apply(compute_sentiment_category_mbert)
-
-
-    # Parsing and One-hot Encoding for List Columns
-    def parse_list_column(column):
-        try:
-            return column.apply(literal_eval)
-        except ValueError:
-            return column
-
-    df['languages'] = parse_list_column(df['languages'])
-    df['genres'] = parse_list_column(df['genres'])
 
-    languages_exploded = df[['appId', 'languages']].explode('languages')
-    genres_exploded = df[['appId', 'genres']].explode('genres')
+    # Decode the list columns straight into long (appId, value) tables; rows
+    # that cannot be decoded are reported by explode_list_column
+    languages_exploded, _ = explode_list_column(df, 'languages')
+    genres_exploded, _ = explode_list_column(df, 'genres')
 
 
     # Expanded Language-to-Countries Mapping
@@ -302,8 +1607,9 @@ def transform_AppStoreData(input_file, output_file):
     # Map language codes to countries
     languages_exploded['Countries'] = languages_exploded['languages'].map(lambda x: ', '.join(language_to_countries.get(x, ['Unknown'])))
     languages_exploded['Countries'] = languages_exploded['Countries'].fillna('Unknown')
-    # Split the 'Countries' column into a list of countries
-    languages_exploded['Countries'] = languages_exploded['Countries'].str.split(', ')
+    # Split the 'Countries' column into a list of countries (astype keeps the
+    # .str accessor usable when a shard has no languages at all)
+    languages_exploded['Countries'] = languages_exploded['Countries'].astype(str).str.split(', ')
     # Explode the 'Countries' column
     languages_exploded = languages_exploded.explode('Countries')
 
@@ -364,20 +1670,6 @@ def transform_AppStoreData(input_file, output_file):
 
 
 
-    # Define categories based on percentiles
-    def price_category(price):
-        if price == 0:
-            return 'Free'
-        elif price <= percentilesPrice[0.25]:
-            return 'Low'
-        elif price <= percentilesPrice[0.50]:
-            return 'Medium'
-        elif price <= percentilesPrice[0.75]:
-            return 'High'
-        else:
-            return 'Very High'    
-            
-
     ## Update frequency categorization
     def categorize_update_frequency(days_since_last_update):
         if days_since_last_update <= 30:
@@ -394,14 +1686,16 @@ def transform_AppStoreData(input_file, output_file):
 
 
     # Process reviews
-    df['Sentiment_Category'] = df['reviews'].apply(compute_sentiment_category_mbert)
+    df['Sentiment_Category'] = run_once_per_review(
+        df['reviews'], lambda reviews: reviews.apply(compute_sentiment_category_mbert), review_groups
+    )
 
     # Update frequency calculation
     df['update_frequency'] = df['days_since_last_update'].apply(categorize_update_frequency)
 
     ## Apply the categorization function to the 'price' column
-    percentilesPrice = df['price'].quantile([0.25, 0.50, 0.75])
-    df['price_category'] = df['price'].apply(price_category)
+    percentilesPrice = df['price'].quantile(PRICE_QUANTILES)
+    df['price_category'] = df['price'].apply(lambda price: price_category(price, percentilesPrice))
 
     ## Apply the categorization function to the 'app_age' column
     df['app_age_category'] = df['app_age'].apply(lambda days: categorize_app_age(days))
@@ -424,9 +1718,9 @@ def transform_AppStoreData(input_file, output_file):
 
 
     # Creating a relational table for device support
-    device_support = df.melt(id_vars=['appId'], value_vars=['supports_iPhone', 'supports_iPad', 'supports_Mac'], var_name='Device', value_name='Supported')
+    device_support = df.melt(id_vars=['appId'], value_vars=DEVICE_ORDER, var_name='Device', value_name='Supported', ignore_index=False)
     device_support = device_support[device_support['Supported'] == 1].drop('Supported', axis=1)
-    device_support.to_csv('AppStore_Device_Support.csv', index=False)
+    outputs.add(device_support, 'AppStore_Device_Support.csv')
 
 
     # Apply the function to the 'free' column
@@ -459,6 +1753,22 @@ def transform_AppStoreData(input_file, output_file):
 
 
 
+    # Keep descriptions, review terms and genres in the similar-app index
+    # before they are dropped (shards would overwrite each other's updates)
+    if (
+        similarity_index is not None
+        and shard is None
+        and not input_superseded('./AppStoreOutput.csv', source_fingerprint)
+    ):
+        genre_labels = genres_exploded.dropna(subset=['genres']).groupby('appId')['genres'].agg(list)
+        update_similarity_index(similarity_index, 'AppStore', pd.DataFrame({
+            'appId': df['appId'],
+            'title': df['title'],
+            'description': df['description'],
+            'processed_reviews': df['processed_reviews'],
+            'labels': df['appId'].map(genre_labels),
+        }))
+
     # Final DataFrame Cleanup and Saving the Cleaned Data
     columns_to_remove = [
         'id', 'icon', 'genreIds', 'primaryGenreId',
@@ -469,25 +1779,83 @@ def transform_AppStoreData(input_file, output_file):
     df.drop(columns_to_remove, axis=1, inplace=True, errors='ignore')
 
     # Save the modified DataFrame to a new CSV file
-    df.to_csv('AppStoreOutput_cleaned.csv', index=False, sep=',', encoding='utf-8')
-    languages_exploded.to_csv('AppStore_Languages.csv', index=False)
-    genres_exploded.to_csv('AppStore_Genres.csv', index=False)
+    outputs.add(df, 'AppStoreOutput_cleaned.csv', sep=',', encoding='utf-8')
+    outputs.add(languages_exploded, 'AppStore_Languages.csv')
+    outputs.add(genres_exploded, 'AppStore_Genres.csv')
 
     # Save the results to separate CSV files
-    bigrams_df.to_csv('AppStore_Bigrams.csv', index=False)
-    word_freq_df.to_csv('AppStore_Word_Frequencies.csv', index=False)
+    outputs.add(bigrams_df, 'AppStore_Bigrams.csv')
+    outputs.add(word_freq_df, 'AppStore_Word_Frequencies.csv')
+    if word_hitters is not None:
+        # Shards keep every counter, the threshold is applied after merging
+        save_heavy_hitters(
+            word_hitters, bigram_hitters, 'AppStore_Heavy_Hitters.csv', outputs,
+            min_frequency if shard is None else 1,
+        )
     print("Bigrams and word frequencies have been saved to CSV files.")
 
+    # Shards save what the merge needs to recompute the global percentiles
+    if shard is not None:
+        save_quantile_summary(df, ['price'], 'AppStore_Quantile_Summary.csv', outputs)
+    if not input_superseded('./AppStoreOutput.csv', source_fingerprint):
+        outputs.write()
+
+    # Keep the history of every run in the analytics store (sharded runs are
+    # appended by the merge)
+    store_run = None
+    if store is not None and shard is None:
+        store_run = append_run_to_store(store, 'AppStore', {
+            'AppStoreOutput_cleaned': df,
+            'AppStore_Languages': languages_exploded,
+            'AppStore_Genres': genres_exploded,
+            'AppStore_Bigrams': bigrams_df,
+            'AppStore_Word_Frequencies': word_freq_df,
+            'AppStore_Device_Support': device_support,
+        }, replaces_run=replace_run)
+
     # Preview the DataFrame
     print(df.head())
 
-    pass
-
-
-def transform_GooglePlayData(input_file, output_file):
+    if time_budget is not None:
+        report_time_budget(time_budget, started_at)
+    if review_fraction < 1:
+        write_input_snapshot(input_bytes, input_path, input_fingerprint)
+    if source_fingerprint is not None:
+        os.remove(input_path)  # The snapshot is no longer needed
+    return review_fraction, store_run, input_fingerprint
+
+
+def transform_GooglePlayData(
+    input_file,
+    output_file,
+    keep_unicode=False,
+    top_k=None,
+    min_frequency=1,
+    heavy_hitters_error=None,
+    store=None,
+    shard=None,
+    time_budget=None,
+    similarity_index=None,
+    output_dir=None,
+    bundle=False,
+    run_id=None,
+    replace_run=None,
+    source_fingerprint=None,
+):
+    # Loaded before the clock starts, it is not part of a --time-budget
+    sentiment_analyzer = get_sentiment_analyzer()
+    started_at = time.perf_counter()
 
     # Load and transform data
-    df = pd.read_csv("./GooglePlayOutput.csv", delimiter=",", encoding="utf-8")
+    input_path, input_bytes, input_fingerprint = read_transform_input(
+        "./GooglePlayOutput.csv", source_fingerprint
+    )
+    if shard is not None:
+        shard = (*shard, shard_run_id(input_fingerprint, run_id))
+    outputs = RunOutputs("GooglePlay", output_dir, shard, bundle)
+    df = pd.read_csv(io.BytesIO(input_bytes), delimiter=",", encoding="utf-8")
+    if shard is not None:
+        df = df[shard_of(df["appId"], shard[1]) == shard[0]]
     df["released"] = pd.to_datetime(df["released"]).dt.tz_localize("UTC")
     df["updated"] = pd.to_datetime(df["updated"], unit="ms", utc=True)
     df["days_since_last_update"] = (datetime.now(timezone.utc) - df["updated"]).dt.days
@@ -499,95 +1867,41 @@ def transform_GooglePlayData(input_file, output_file):
     df["score"] = pd.to_numeric(df["score"], errors="coerce")
     df["free"] = df["free"].astype(int)
 
-    # Ensure the 'IAPRange' column exists and is of string type
-    if "IAPRange" in df.columns and df["IAPRange"].dtype != object:
-        df["IAPRange"] = df["IAPRange"].astype(str)
-
     
 
-    # Mapping from language names to NLTK compatible language codes
-    nltk_lang_map = {
-        "ar": "arabic",
-        "az": "azerbaijani",
-        "eu": "basque",
-        "bn": "bengali",
-        "ca": "catalan",
-        "zh": "chinese",
-        "da": "danish",
-        "nl": "dutch",
-        "en": "english",
-        "fi": "finnish",
-        "fr": "french",
-        "de": "german",
-        "el": "greek",
-        "he": "hebrew",
-        "hu": "hungarian",
-        "id": "indonesian",
-        "it": "italian",
-        "kk": None,  # No support in NLTK
-        "ne": None,  # No support in NLTK
-        "no": "norwegian",
-        "pt": "portuguese",
-        "ro": "romanian",
-        "ru": "russian",
-        "sl": "slovene",
-        "es": "spanish",
-        "sv": "swedish",
-        "tg": None,  # No support in NLTK
-        "tr": "turkish",
-    }
+    # Text stages run once per unique (appId, review) and are fanned out to duplicates
+    review_groups = group_duplicate_reviews(df)
 
-    def get_stopwords(text):
-        try:
-            # Detect the language of the text
-            lang = detect(text)
-            # Get the stopwords for the detected language
-            stopwords_lang = nltk_lang_map.get(lang, "english")
-            if stopwords_lang:
-                return set(stopwords.words(stopwords_lang))
-            else:
-                return set(stopwords.words("english"))
-        except Exception as e:
-            print("Error in detecting language or loading stopwords:", e)
-            return set(stopwords.words("english"))
-
-    def preprocess_and_split_reviews(reviews):
-        # Convert reviews to string to avoid TypeError with non-string inputs
-        if pd.isna(reviews):
-            return ""  # Return an empty string if the review is NaN
-        reviews = str(reviews)
-        try:
-            # Use language-specific stopwords
-            stop_words = get_stopwords(reviews)
-        except Exception as e:
-            print("Error using language-specific stopwords:", e)
-            stop_words = set(
-                stopwords.words("english")
-            )  # Default to English if error occurs
-
-        reviews = re.sub('\\s+', ' ', reviews).strip().lower()
-        reviews = re.sub(r'[^\u0000-\u007F]+', '', reviews)
+    # Sample reviews per app when the text stages would not fit in the time budget
+    review_fraction = 1.0
+    if time_budget is not None:
+        review_fraction = apply_time_budget(df, review_groups, time_budget, started_at, keep_unicode)
 
-        # Remove stopwords
-        words = [
-            word for word in reviews.split() if word not in stop_words and len(word) > 1
-        ]
-        return " ".join(words)
-
-    # Apply the modified function to your DataFrame
-    df["processed_reviews"] = df["reviews"].apply(preprocess_and_split_reviews)
+    # Normalize reviews and remove language-specific stopwords
+    df["processed_reviews"] = run_once_per_review(
+        df["reviews"], lambda reviews: preprocess_reviews(reviews, keep_unicode=keep_unicode), review_groups
+    )
 
+    # Optional bounded summaries of the corpus-wide most frequent terms
+    word_hitters = bigram_hitters = None
+    if heavy_hitters_error is not None:
+        word_hitters = HeavyHitters.from_error_rate(heavy_hitters_error)
+        bigram_hitters = HeavyHitters.from_error_rate(heavy_hitters_error)
 
-            # Function to get and flatten bigrams with their frequencies
+    # Function to get and flatten bigrams with their frequencies
     def get_and_flatten_bigrams(text):
         if len(text.split()) < 2:
             return []
         blob = TextBlob(text)
-        bigrams = [' '.join(bigram) for bigram in blob.ngrams(2)]
-        return list(Counter(bigrams).items())
+        bigrams = Counter(' '.join(bigram) for bigram in blob.ngrams(2))
+        if bigram_hitters is not None:
+            bigram_hitters.update(bigrams)
+        return limit_term_frequencies(bigrams, top_k, min_frequency)
 
     # Assuming 'processed_reviews' column is already in the dataframe 'df'
-    df['bigrams'] = df['processed_reviews'].apply(get_and_flatten_bigrams)
+    df["bigrams"] = run_once_per_review(
+        df["processed_reviews"], lambda texts: texts.apply(get_and_flatten_bigrams), review_groups
+    )
 
     # Explode the bigrams into separate rows, including their frequencies
     bigrams_rows = df.explode('bigrams')
@@ -600,9 +1914,13 @@ def transform_GooglePlayData(input_file, output_file):
 
     def flatten_word_frequencies(text):
         freqs = Counter(text.split())
-        return list(freqs.items())
+        if word_hitters is not None:
+            word_hitters.update(freqs)
+        return limit_term_frequencies(freqs, top_k, min_frequency)
 
-    df["word_freq"] = df["processed_reviews"].apply(flatten_word_frequencies)
+    df["word_freq"] = run_once_per_review(
+        df["processed_reviews"], lambda texts: texts.apply(flatten_word_frequencies), review_groups
+    )
     word_freq_rows = df.explode("word_freq")
     word_freq_df = pd.DataFrame(
         {
@@ -649,7 +1967,9 @@ def transform_GooglePlayData(input_file, output_file):
             print(f"Error processing text: {e}")
             return "Missing"  # Default to 'Missing' in case of an error
 
-    df["sentiment_category"] = df['processed_reviews'].apply(compute_sentiment_category_mbert)
+    df["sentiment_category"] = run_once_per_review(
+        df["processed_reviews"], lambda texts: texts.apply(compute_sentiment_category_mbert), review_groups
+    )
 
     ## Rating ratio categorization
     def categorize_rating_ratio(ratio):
@@ -701,19 +2021,6 @@ def transform_GooglePlayData(input_file, output_file):
         else:
             return "Very High"
 
-    ## Engagement score categorization
-    def categorize_engagement_score(score, percentiles):
-        if score >= percentiles[0.9]:
-            return "Very High Engagement"
-        elif score >= percentiles[0.75]:
-            return "High Engagement"
-        elif score >= percentiles[0.5]:
-            return "Moderate Engagement"
-        elif score >= percentiles[0.25]:
-            return "Low Engagement"
-        else:
-            return "Very Low Engagement"
-
     ## Update frequency categorization
     def categorize_update_frequency(days_since_last_update):
         if days_since_last_update <= 30:
@@ -748,16 +2055,15 @@ def transform_GooglePlayData(input_file, output_file):
             return "paid"
 
     ## Histogram parsing
-    def parse_histogram(row):
-        try:
-            histogram_dict = json.loads(row)
-        except json.JSONDecodeError:
-            return pd.Series([float("nan")] * 5)
-        return pd.Series(histogram_dict)
-
-    histogram_columns = df["histogram"].apply(parse_histogram)
-    histogram_columns.columns = ["1*", "2*", "3*", "4*", "5*"]
-    df = pd.concat([df, histogram_columns], axis=1)
+    histogram_counts, histogram_valid = parse_histograms(df["histogram"])
+    histogram_columns = pd.DataFrame(
+        histogram_counts, columns=HISTOGRAM_COLUMNS, index=df.index
+    )
+    if not histogram_valid.all():
+        # Undecodable histograms stay NaN, which needs a float column
+        histogram_columns = histogram_columns.astype(float)
+        histogram_columns.loc[~histogram_valid] = float("nan")
+    df[HISTOGRAM_COLUMNS] = histogram_columns
 
     # Calculations
     df["app_age"] = (df["updated"] - df["released"]).dt.days
@@ -765,23 +2071,8 @@ def transform_GooglePlayData(input_file, output_file):
     df["engagement_score"] = (df["score"] * df["ratings"]) / df["minInstalls"]
     df["install_to_rating"] = df["minInstalls"] / (df["ratings"] + 1e-10)
 
-    # Load your DataFrame (assuming you've already loaded it into 'df')
-    df["IAPRange"] = df["IAPRange"].astype(
-        str
-    )  # Ensure the column is treated as string
-
-    # Extract using the updated regex
-    df[["CurrencySymbolMin", "IAPMin", "CurrencySymbolMax", "IAPMax"]] = df[
-        "IAPRange"
-    ].str.extract(r"([^\d]+)(\d+[\.,]?\d*) - ([^\d]+)(\d+[\.,]?\d*)")
-
-    # Normalize decimal points and convert to float
-    df["IAPMin"] = df["IAPMin"].str.replace(",", ".").astype(float)
-    df["IAPMax"] = df["IAPMax"].str.replace(",", ".").astype(float)
-
-    # Optionally clean up currency symbols by stripping spaces or other characters
-    df["CurrencySymbolMin"] = df["CurrencySymbolMin"].str.strip()
-    df["CurrencySymbolMax"] = df["CurrencySymbolMax"].str.strip()
+    # Split the IAP price range into currency symbols and float bounds
+    df[IAP_RANGE_COLUMNS] = parse_iap_ranges(df["IAPRange"])
 
     # Preview the results
 
@@ -793,7 +2084,7 @@ def transform_GooglePlayData(input_file, output_file):
     df["rating_ratio_category"] = df["rating_ratio"].apply(
         lambda ratio: categorize_rating_ratio(ratio)
     )
-    percentiles = df["engagement_score"].quantile([0.25, 0.5, 0.75, 0.9]).to_dict()
+    percentiles = df["engagement_score"].quantile(ENGAGEMENT_QUANTILES).to_dict()
     df["engagement_score_category"] = df["engagement_score"].apply(
         lambda x: categorize_engagement_score(x, percentiles)
     )
@@ -807,6 +2098,27 @@ def transform_GooglePlayData(input_file, output_file):
     percentilesPrice = df["price"].quantile([0.25, 0.50, 0.75])
     df["price_category"] = df["price"].apply(lambda price: categorize_price(price))
 
+    # Keep descriptions, review terms and categories in the similar-app index
+    # before they are dropped (shards would overwrite each other's updates)
+    if (
+        similarity_index is not None
+        and shard is None
+        and not input_superseded("./GooglePlayOutput.csv", source_fingerprint)
+    ):
+        update_similarity_index(
+            similarity_index,
+            "GooglePlay",
+            pd.DataFrame(
+                {
+                    "appId": df["appId"],
+                    "title": df["title"],
+                    "description": df["description"],
+                    "processed_reviews": df["processed_reviews"],
+                    "labels": df["categories"],
+                }
+            ),
+        )
+
     # Clean-up and Output
     columns_to_remove = [
         
@@ -854,13 +2166,52 @@ def transform_GooglePlayData(input_file, output_file):
     df.drop(columns_to_remove, axis=1, inplace=True, errors="ignore")
     df["updated"] = df["updated"].dt.strftime("%Y-%m-%d")
     df["released"] = df["released"].dt.strftime("%Y-%m-%d")
-    df.to_csv("GooglePlayOutput_cleaned.csv", index=False, sep=",", encoding="utf-8")
-    categories_exploded.to_csv("GooglePlay_Categories.csv", index=False)
-    bigrams_df.to_csv("GooglePlay_Bigrams.csv", index=False)
-    word_freq_df.to_csv("GooglePlay_Word_Frequencies.csv", index=False)
+    outputs.add(df, "GooglePlayOutput_cleaned.csv", sep=",", encoding="utf-8")
+    outputs.add(categories_exploded, "GooglePlay_Categories.csv")
+    outputs.add(bigrams_df, "GooglePlay_Bigrams.csv")
+    outputs.add(word_freq_df, "GooglePlay_Word_Frequencies.csv")
+    if word_hitters is not None:
+        # Shards keep every counter, the threshold is applied after merging
+        save_heavy_hitters(
+            word_hitters,
+            bigram_hitters,
+            "GooglePlay_Heavy_Hitters.csv",
+            outputs,
+            min_frequency if shard is None else 1,
+        )
+
+    # Shards save what the merge needs to recompute the global percentiles
+    if shard is not None:
+        save_quantile_summary(
+            df, ["engagement_score"], "GooglePlay_Quantile_Summary.csv", outputs
+        )
+    if not input_superseded("./GooglePlayOutput.csv", source_fingerprint):
+        outputs.write()
+
+    # Keep the history of every run in the analytics store (sharded runs are
+    # appended by the merge)
+    store_run = None
+    if store is not None and shard is None:
+        store_run = append_run_to_store(
+            store,
+            "GooglePlay",
+            {
+                "GooglePlayOutput_cleaned": df,
+                "GooglePlay_Categories": categories_exploded,
+                "GooglePlay_Bigrams": bigrams_df,
+                "GooglePlay_Word_Frequencies": word_freq_df,
+            },
+            replaces_run=replace_run,
+        )
 
     print(df.head())  # This will print the first 5 rows of the DataFrame after cleanup
-    pass
+    if time_budget is not None:
+        report_time_budget(time_budget, started_at)
+    if review_fraction < 1:
+        write_input_snapshot(input_bytes, input_path, input_fingerprint)
+    if source_fingerprint is not None:
+        os.remove(input_path)  # The snapshot is no longer needed
+    return review_fraction, store_run, input_fingerprint
 
 
 if __name__ == "__main__":
@@ -870,12 +2221,173 @@ if __name__ == "__main__":
     parser.add_argument("function_name", help="The name of the function to execute")
     parser.add_argument("input_file", help="The path to the input file")
     parser.add_argument("output_file", help="The path to the output file")
+    parser.add_argument(
+        "--keep-unicode",
+        action="store_true",
+        help="Keep non-Latin letters in reviews instead of stripping all non-ASCII text",
+    )
+    parser.add_argument(
+        "--top-k",
+        type=positive_int,
+        help="Keep only the k most frequent words and bigrams per app",
+    )
+    parser.add_argument(
+        "--min-frequency",
+        type=positive_int,
+        default=1,
+        help="Drop words and bigrams that occur fewer times than this",
+    )
+    parser.add_argument(
+        "--heavy-hitters-error",
+        type=error_rate,
+        help="Also save corpus-wide heavy hitters, with counts accurate to "
+        "this fraction of all words/bigrams (e.g. 0.001)",
+    )
+    parser.add_argument(
+        "--store",
+        help="SQLite analytics store to append the outputs of this run to",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="Only process the apps of shard i of N (0 <= i < N) and write partial "
+        "outputs; combine them with merge_AppStoreData / merge_GooglePlayData",
+    )
+    parser.add_argument(
+        "--keep-shards",
+        action="store_true",
+        help="Keep the partial files of the shards after merging them",
+    )
+    parser.add_argument(
+        "--run-id",
+        help="Identifier of a sharded run, used by the shards and the merge "
+        "(defaults to a fingerprint of the scraped input)",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        help="Seconds the transform may take; reviews are sampled per app when the "
+        "budget is at risk and a full-fidelity pass then replaces the outputs",
+    )
+    parser.add_argument(
+        "--replace-run",
+        type=int,
+        help="Run of the analytics store that this run replaces (set by the "
+        "full-fidelity pass of a --time-budget transform)",
+    )
+    parser.add_argument(
+        "--source-fingerprint",
+        help="Fingerprint of the input snapshot to transform (set by the "
+        "full-fidelity pass of a --time-budget transform)",
+    )
+    parser.add_argument(
+        "--similarity-index",
+        help="Similar-app index file to update with the apps of this run",
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="Publish all outputs of the run, with a manifest, to this directory in "
+        "one atomic step instead of writing them to the working directory",
+    )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Also pack the outputs and manifest into one .tar.gz in --output-dir",
+    )
+    parser.add_argument("--table", help="Store table to query with query_store")
+    parser.add_argument("--app-id", help="App to query with query_store or query_similar")
+    parser.add_argument(
+        "--columns",
+        type=lambda value: value.split(","),
+        help="Comma-separated columns returned by query_store (default: all)",
+    )
+    parser.add_argument(
+        "--filter",
+        action="append",
+        type=parse_store_filter,
+        default=[],
+        metavar="COLUMN=VALUE",
+        help="Only query rows where COLUMN equals VALUE, e.g. --filter word=crash "
+        "(repeatable)",
+    )
+    parser.add_argument(
+        "--last-runs", type=positive_int, help="Only query the most recent runs"
+    )
+    parser.add_argument("--since", help="Only query runs scraped on or after this date")
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of apps returned by query_similar"
+    )
+    parser.add_argument(
+        "--store-name",
+        choices=["AppStore", "GooglePlay"],
+        help="Store of the app queried with query_similar, for appIds in both stores",
+    )
 
     args = parser.parse_args()
+    if args.shard is not None and args.similarity_index is not None:
+        # Shards would overwrite each other's apps and the merged tables no
+        # longer carry the descriptions and review terms the index needs
+        parser.error("--similarity-index cannot be used with --shard")
+    options = dict(
+        keep_unicode=args.keep_unicode,
+        top_k=args.top_k,
+        min_frequency=args.min_frequency,
+        heavy_hitters_error=args.heavy_hitters_error,
+        store=args.store,
+        shard=args.shard,
+        run_id=args.run_id,
+        time_budget=args.time_budget,
+        replace_run=args.replace_run,
+        source_fingerprint=args.source_fingerprint,
+        similarity_index=args.similarity_index,
+        output_dir=args.output_dir,
+        bundle=args.bundle,
+    )
 
     # Call the appropriate function based on the argument
     if args.function_name == "transform_GooglePlayData":
-        transform_GooglePlayData(args.input_file, args.output_file)
+        review_fraction, store_run, input_fingerprint = transform_GooglePlayData(
+            args.input_file, args.output_file, **options
+        )
+        if review_fraction < 1:
+            start_full_fidelity_pass(sys.argv, store_run, input_fingerprint)
     elif args.function_name == "transform_AppStoreData":
-        transform_AppStoreData(args.input_file, args.output_file)
+        review_fraction, store_run, input_fingerprint = transform_AppStoreData(
+            args.input_file, args.output_file, **options
+        )
+        if review_fraction < 1:
+            start_full_fidelity_pass(sys.argv, store_run, input_fingerprint)
+    elif args.function_name in ("merge_AppStoreData", "merge_GooglePlayData"):
+        merge_shards(
+            args.function_name.replace("merge_", "").replace("Data", ""),
+            heavy_hitters_error=args.heavy_hitters_error,
+            min_frequency=args.min_frequency,
+            store=args.store,
+            output_dir=args.output_dir,
+            bundle=args.bundle,
+            run_id=args.run_id,
+            keep_shards=args.keep_shards,
+        )
+    elif args.function_name == "query_similar":
+        # Here input_file is the similarity index and output_file the CSV of similar apps
+        similar_apps = query_similar_apps(
+            args.input_file, args.app_id, top=args.top, store_name=args.store_name
+        )
+        similar_apps.to_csv(args.output_file, index=False)
+        print(similar_apps)
+    elif args.function_name == "query_store":
+        if args.table is None or args.app_id is None:
+            parser.error("query_store requires --table and --app-id")
+        # Here input_file is the store and output_file the CSV the history is written to
+        history = query_app_history(
+            args.input_file,
+            args.table,
+            args.app_id,
+            columns=args.columns,
+            filters=dict(args.filter),
+            last_runs=args.last_runs,
+            since=args.since,
+        )
+        history.to_csv(args.output_file, index=False)
+        print(history)
     # Add more elif statements for additional functions
\ No newline at end of file